@@ -1,7 +1,13 @@
 import os
+import io
 import ast
 import csv
+import hashlib
+import pickle
 import tokenize
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from operator import itemgetter
 
 # Tipos de nó que contam como decisões para complexidade ciclomática
 DECISION_NODES = (
@@ -14,126 +20,292 @@ DECISION_NODES = (
     ast.IfExp,
 )
 
+# Mesmos tipos em um frozenset: `type(n) in _DECISION_TYPES` é uma busca O(1), sem percorrer a MRO
+_DECISION_TYPES = frozenset(DECISION_NODES)
+
+# Arquivo onde as métricas já calculadas são guardadas entre execuções
+CACHE_FILE = '.pymetrix_cache.pkl'
+
+def ast_metrics(tree: ast.AST) -> dict:
+    """
+    Percorre o AST uma única vez e calcula todas as métricas estruturais do arquivo.
+    """
+    n_funcs = n_classes = n_params = n_methods = 0
+    n_raises = n_except = 0
+    n_internal = n_external = 0
+    cyclo = 1  # McCabe
+    depth = 0
+    defined_funcs = set()
+
+    # Fase 1: nós de nível de sentença. Funções, classes, raise, except e os
+    # desvios If/For/While/Try/With nunca aparecem dentro de expressões, então
+    # as subárvores de expressão são separadas para a fase 2.
+    stack = deque([(tree, 0)])
+    exprs = []
+    while stack:
+        node, d = stack.pop()
+        if d > depth:
+            depth = d
+
+        t = type(node)
+        if t in _DECISION_TYPES:
+            cyclo += 1
+        elif t is ast.FunctionDef:
+            n_funcs += 1
+            n_params += len(node.args.args)
+            defined_funcs.add(node.name)
+        elif t is ast.ClassDef:
+            n_classes += 1
+            n_methods += sum(isinstance(n, ast.FunctionDef) for n in node.body)
+        elif t is ast.Raise:
+            n_raises += 1
+        elif t is ast.ExceptHandler:
+            n_except += 1
+
+        for child in ast.iter_child_nodes(node):
+            if isinstance(child, ast.expr):
+                exprs.append((child, d + 1))
+            else:
+                stack.append((child, d + 1))
+
+    # Fase 2: subárvores de expressão, onde só interessam BoolOp, IfExp e Call.
+    # Todas as funções já foram coletadas, então as chamadas são classificadas aqui.
+    while exprs:
+        node, d = exprs.pop()
+        if d > depth:
+            depth = d
+
+        t = type(node)
+        if t is ast.Call:
+            func = node.func
+            if isinstance(func, ast.Name) and func.id in defined_funcs:
+                n_internal += 1
+            else:
+                n_external += 1
+        elif t is ast.BoolOp:
+            cyclo += len(node.values)
+        elif t is ast.IfExp:
+            cyclo += 1
+
+        for child in ast.iter_child_nodes(node):
+            exprs.append((child, d + 1))
+
+    # Estatísticas de funções e classes
+    avg_params = (n_params / n_funcs) if n_funcs else 0.0
+    avg_methods = (n_methods / n_classes) if n_classes else 0.0
+
+    return {
+        'NOF': n_funcs, #Number of Functions
+        'NOC': n_classes,#Number of Classes
+        'APF': round(avg_params, 2), #Average Parameters per Function
+        'AMC': round(avg_methods, 2), #Average Methods per Class
+        'NER': n_raises, #Number of Exception Raises
+        'NEH': n_except, #Number of Exception Handlers 
+        'CYC': cyclo, #Cyclomatic Complexity
+        'MAD': depth, #Max AST Depth
+    }
+
 def count_decision_points(tree: ast.AST) -> int:
     """
     Conta nós de decisão no AST para calcular complexidade ciclomática.
     Cada BoolOp (and/or) adiciona decisões extras por cada operador lógico.
+    Atalho para a métrica CYC de ast_metrics (não é usado por analyze_file).
     """
-    cnt = sum(isinstance(n, DECISION_NODES) for n in ast.walk(tree))
-    cnt += sum(len(n.values) - 1 for n in ast.walk(tree)
-               if isinstance(n, ast.BoolOp))
-    return cnt + 1  # McCabe
+    return ast_metrics(tree)['CYC']
 
 def max_ast_depth(tree: ast.AST) -> int:
     """
     Calcula a profundidade máxima da árvore AST.
+    Atalho para a métrica MAD de ast_metrics (não é usado por analyze_file).
     """
+    return ast_metrics(tree)['MAD']
 
-    def visit(node: ast.AST, depth: int = 0):
-        depths = [depth]
-        for child in ast.iter_child_nodes(node):
-            depths.append(visit(child, depth + 1))
-        return max(depths)
-
-    return visit(tree)
+def split_source_lines(src: str) -> list[str]:
+    """
+    Divide o código-fonte nas suas linhas físicas, delimitadas por '\\n' (como ao iterar o arquivo).
+    Diferente de str.splitlines(), não quebra em form feed ('\\x0c') nem em outros separadores Unicode.
+    """
+    lines = src.split('\n')
+    if lines[-1] == '':
+        lines.pop()  # A quebra de linha final não abre uma nova linha
+    return lines
 
-def count_comments_and_blanks(path: str) -> tuple[int, int]:
+def count_comments_and_blanks_from_src(src: str, lines: list[str] = None) -> tuple[int, int]:
     """
-    Conta comentários e linhas em branco usando o módulo tokenize.
-    Comentários são detectados por tokens COMMENT.
+    Conta comentários e linhas em branco a partir do código-fonte já carregado.
+    Comentários são detectados por tokens COMMENT do módulo tokenize.
+    lines são as linhas físicas do código (ver split_source_lines).
+
+    Uma linha só com form feed conta como uma única linha em branco:
+
+    >>> count_comments_and_blanks_from_src('x = 1  # um\\n\\x0c\\ny = 2\\n')
+    (1, 1)
     """
-    comments = blanks = 0
+    if lines is None:
+        lines = split_source_lines(src)
 
     # Contar comentários
-    with open(path, 'rb') as f:
-        tokens = tokenize.tokenize(f.readline)
-        for tok in tokens:
-            if tok.type == tokenize.COMMENT:
-                comments += 1
+    tokens = tokenize.generate_tokens(io.StringIO(src).readline)
+    comments = sum(1 for tok in tokens if tok.type == tokenize.COMMENT)
 
-    # Contar linhas em branco
-    with open(path, 'r', encoding='utf-8', errors='ignore') as f:
-        for line in f:
-            if not line.strip():
-                blanks += 1
+    # Contar linhas em branco: vazias ou só com espaços (contagens feitas em C, sem strip por linha)
+    blanks = lines.count('') + sum(map(str.isspace, lines))
 
     return comments, blanks
 
-def analyze_file(path: str) -> dict:
+def count_comments_and_blanks(path: str) -> tuple[int, int]:
     """
-    Analisa um arquivo .py, extrai diversas métricas e retorna um dicionário com os resultados.
+    Conta comentários e linhas em branco de um arquivo, lendo-o uma única vez.
     """
     with open(path, 'r', encoding='utf-8', errors='ignore') as f:
         src = f.read()
 
-    tree = ast.parse(src)
-
-    # Métricas básicas
-    loc = sum(1 for l in src.splitlines() if l.strip())
-    comments, blanks = count_comments_and_blanks(path)
-
-    # Coleta funções e classes
-    funcs = [n for n in ast.walk(tree) if isinstance(n, ast.FunctionDef)]
-    classes = [n for n in ast.walk(tree) if isinstance(n, ast.ClassDef)]
-
-    # Estatísticas de funções e classes
-    n_funcs = len(funcs)
-    n_classes = len(classes)
-
-    avg_params = (sum(len(f.args.args) for f in funcs) / n_funcs) if n_funcs else 0.0
+    return count_comments_and_blanks_from_src(src)
 
-    methods_per_class = [
-        sum(isinstance(n, ast.FunctionDef) for n in cls.body)
-        for cls in classes
-    ]
+def analyze_file(path: str) -> dict:
+    """
+    Analisa um arquivo .py, extrai diversas métricas e retorna um dicionário com os resultados.
+    """
+    with open(path, 'r', encoding='utf-8', errors='ignore') as f:
+        src = f.read()
 
-    avg_methods = (sum(methods_per_class) / n_classes) if n_classes else 0.0
-    
-    # Exceções Levantadas e Tratadas
-    n_raises = sum(isinstance(n, ast.Raise) for n in ast.walk(tree))
-    n_except = sum(isinstance(n, ast.ExceptHandler) for n in ast.walk(tree))
+    return analyze_source(src, path)
 
-    # Numero de chamadas internas e externas
-    defined_funcs = {f.name for f in funcs}
-    n_internal = n_external = 0
-    for n in ast.walk(tree):
-        if isinstance(n, ast.Call):
-            func = n.func
-            if isinstance(func, ast.Name) and func.id in defined_funcs:
-                n_internal += 1
-            else:
-                n_external += 1
+def analyze_source(src: str, path: str) -> dict:
+    """
+    Extrai as métricas de um código-fonte já carregado; path é usado apenas como identificador.
+    LOC e BLK são contados sobre as mesmas linhas físicas (ver split_source_lines):
 
+    >>> metrics = analyze_source('x = 1\\n\\x0c\\n\\ny = 2', 'exemplo.py')
+    >>> metrics['LOC'], metrics['BLK']
+    (2, 2)
+    """
+    tree = ast.parse(src)
 
-    # Complexidade e profundidade AST
-    cyclo = count_decision_points(tree)
-    depth = max_ast_depth(tree)
+    # Métricas básicas: LOC = total de linhas físicas - linhas em branco
+    lines = split_source_lines(src)
+    comments, blanks = count_comments_and_blanks_from_src(src, lines)
+    loc = len(lines) - blanks
 
     return {
         'FILE': path,
         'LOC': loc, #Lines of Code
         'COM': comments, #Lines of Comments
         'BLK': blanks, #Lines of Blank
-        'NOF': n_funcs, #Number of Functions
-        'NOC': n_classes,#Number of Classes
-        'APF': round(avg_params, 2), #Average Parameters per Function
-        'AMC': round(avg_methods, 2), #Average Methods per Class
-        'NER': n_raises, #Number of Exception Raises
-        'NEH': n_except, #Number of Exception Handlers 
-        'CYC': cyclo, #Cyclomatic Complexity
-        'MAD': depth, #Max AST Depth
+        **ast_metrics(tree), #NOF, NOC, APF, AMC, NER, NEH, CYC e MAD
         'BUG': 0 
     }
 
-def scan_directory(root: str):
+def find_python_files(root: str) -> list[str]:
+    """
+    Lista recursivamente os caminhos de todos os arquivos .py de um diretório.
+    Usa os.scandir, que aproveita o tipo de cada entrada já retornado pelo
+    sistema operacional e evita um stat por arquivo.
+    """
+    paths = []
+    stack = [root]
+    while stack:
+        dirpath = stack.pop()
+        try:
+            entries = os.scandir(dirpath)
+        except OSError:
+            continue  # Diretórios ilegíveis são ignorados, como em os.walk
+
+        with entries:
+            for entry in entries:
+                if entry.is_dir():
+                    if not entry.is_symlink():  # Não segue links simbólicos, como em os.walk
+                        stack.append(entry.path)
+                elif entry.name.endswith('.py'):
+                    paths.append(entry.path)
+    return paths
+
+# Hashes de conteúdo já presentes no cache, repassados a cada processo do pool por _init_worker
+_cached_keys = frozenset()
+
+def _init_worker(cached_keys: frozenset) -> None:
+    """
+    Inicializa um processo do pool com os hashes de conteúdo já presentes no cache.
+    """
+    global _cached_keys
+    _cached_keys = cached_keys
+
+def _analyze_file_cached(path: str) -> tuple[str, dict]:
+    """
+    Lê o arquivo uma única vez, identifica seu conteúdo pelo hash SHA-1 e só o analisa
+    se esse conteúdo ainda não estiver no cache. Retorna o hash e as métricas (None se já estiver no cache).
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+
+    key = hashlib.sha1(data).hexdigest()
+    if key in _cached_keys:
+        return key, None
+
+    # Mesma decodificação de open(path, 'r', encoding='utf-8', errors='ignore'), inclusive as quebras de linha
+    src = io.TextIOWrapper(io.BytesIO(data), encoding='utf-8', errors='ignore').read()
+    return key, analyze_source(src, path)
+
+def _metrics_version() -> str:
+    """
+    Identifica a versão do código de métricas pelo hash SHA-1 do próprio pymetrix.py.
+    Qualquer alteração neste módulo invalida o cache.
+    """
+    with open(__file__, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+def _load_cache(cache_path: str) -> dict:
+    """
+    Carrega o cache de métricas do disco. Retorna um cache vazio se o arquivo não existir,
+    estiver corrompido ou tiver sido gerado por outra versão do código de métricas.
+    """
+    try:
+        with open(cache_path, 'rb') as f:
+            payload = pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError):
+        return {}
+
+    if not isinstance(payload, dict) or payload.get('version') != _metrics_version():
+        return {}
+    return payload['metrics']
+
+def _save_cache(cache: dict, cache_path: str) -> None:
+    """
+    Persiste o cache de métricas no disco, junto com a versão do código de métricas.
+    """
+    with open(cache_path, 'wb') as f:
+        pickle.dump({'version': _metrics_version(), 'metrics': cache}, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+def scan_directory(root: str, max_workers: int = None, cache_path: str = CACHE_FILE):
     """
     Varre recursivamente um diretório e processa todos os arquivos .py.
+    Os arquivos são analisados em paralelo por um pool de processos
+    (um processo por CPU, por padrão). Arquivos cujo conteúdo já foi
+    analisado são lidos do cache em cache_path (None desativa o cache).
     """
-    for dirpath, _, files in os.walk(root):
-        for name in files:
-            if name.endswith('.py'):
-                path = os.path.join(dirpath, name)
-                yield analyze_file(path)
+    paths = find_python_files(root)
+    if not paths:
+        return
+
+    max_workers = max_workers or os.cpu_count()
+    if not cache_path:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            yield from executor.map(analyze_file, paths, chunksize=32)
+        return
+
+    # O hash de cada arquivo é calculado no próprio processo do pool, a partir dos mesmos bytes analisados
+    cache = _load_cache(cache_path)
+    fresh_cache = {}
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker,
+                             initargs=(frozenset(cache),)) as executor:
+        results = executor.map(_analyze_file_cached, paths, chunksize=32)
+        for path, (key, metrics) in zip(paths, results):
+            if metrics is None:
+                metrics = dict(cache[key], FILE=path)
+            fresh_cache[key] = dict(metrics)
+            yield metrics
+
+    _save_cache(fresh_cache, cache_path)
 
 def save_to_csv(data: list[dict], outcsv: str) -> None:
     """
@@ -142,7 +314,12 @@ def save_to_csv(data: list[dict], outcsv: str) -> None:
     if not data:
         raise ValueError("Nenhum dado para salvar")
 
+    fieldnames = list(data[0].keys())
+    getter = itemgetter(*fieldnames)
+    # itemgetter com uma única chave devolve o valor, não uma tupla
+    rows = map(getter, data) if len(fieldnames) > 1 else ((getter(row),) for row in data)
+
     with open(outcsv, 'w', newline='', encoding='utf-8') as f:
-        writer = csv.DictWriter(f, fieldnames=data[0].keys())
-        writer.writeheader()
-        writer.writerows(data)
+        writer = csv.writer(f)
+        writer.writerow(fieldnames)
+        writer.writerows(rows)
@@ -8,9 +8,42 @@ import re
 import git
 import logging
 import os
+from collections.abc import Iterable, Iterator
+from concurrent.futures import ThreadPoolExecutor
+
+# Limite de requisições simultâneas à API do GitHub (evita os secondary rate limits)
+GITHUB_MAX_WORKERS = 8
+
+# Arquivos irrelevantes para a predição (testes, exemplos e documentação), compilado uma única vez
+IRRELEVANT_FILES_PATTERN = re.compile(r'(?:test|example|doc|sample)', re.IGNORECASE)
+
+# Tipos das colunas do dataset bruto: contagens cabem em int32 e médias em float32
+RAW_DATASET_DTYPES = {column: 'int32' for column in ('LOC', 'COM', 'BLK', 'NOF', 'NOC', 'NER', 'NEH', 'CYC', 'MAD', 'BUG')}
+RAW_DATASET_DTYPES.update({column: 'float32' for column in ('APF', 'AMC')})
+
+# Cache de métricas do pymetrix, mantido ao lado do script (independe do diretório de trabalho)
+METRICS_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), pymetrix.CACHE_FILE)
+
+def fetch_pages(fetch_page, first_page, number_of_pages: int) -> list:
+    """
+    Essa função busca em paralelo as páginas restantes de uma consulta paginada à API do GitHub.
+    As requisições são feitas por um pool de threads, pois o tempo é dominado pela espera da rede.
+
+    Parameters:
+        fetch_page (callable): Função que recebe o número da página e retorna a página buscada.
+        first_page: A primeira página da consulta, já buscada.
+        number_of_pages (int): O número total de páginas da consulta.
+
+    Returns:
+        pages (list): A lista de páginas, em ordem, começando por first_page.
+    """
+    with ThreadPoolExecutor(max_workers=GITHUB_MAX_WORKERS) as executor:
+        remaining_pages = list(executor.map(fetch_page, range(2, number_of_pages + 1)))
+
+    return [first_page] + remaining_pages
 
 def extract_non_patch_releases(github_token: str=None, github_owner: str="scikit-learn", 
-                     github_repository: str="scikit-learn") -> list[dict]:
+                     github_repository: str="scikit-learn", api: GhApi=None) -> list[dict]:
     """
     Essa função extrai informações sobre a lista de releases do projeto hospedado no GitHub. 
     São consideradas apenas releases que seguem a seguinte regras: 
@@ -22,6 +55,7 @@ def extract_non_patch_releases(github_token: str=None, github_owner: str="scikit
         github_token (str): O token de acesso do GitHub. Valor padrão é None.
         github_owner (str): O nome do owner do projeto. Valor padrão é "scikit-learn". 
         github_repository (str): O nome do repositório do projeto. Valor padrão é "scikit-learn".
+        api (GhApi): Cliente da API do GitHub já configurado; quando informado, github_token é ignorado. Valor padrão é None (cria um novo cliente).
     
     Returns:
         filtered_releases (list[dict]): A lista de releases em ordem decrescente de data de publicação. 
@@ -31,13 +65,15 @@ def extract_non_patch_releases(github_token: str=None, github_owner: str="scikit
         “published_at”(data de publicação da relsease).
     """
 
-    api = GhApi(token=github_token, owner=github_owner, repo=github_repository)
+    if api is None:
+        api = GhApi(token=github_token, owner=github_owner, repo=github_repository)
     releases = []
-    fetched_releases = api.repos.list_releases(github_owner, github_repository, per_page=100, page=1)
-    number_of_pages = math.ceil(len(fetched_releases)/100.00)
+    fetch_page = lambda page_number: api.repos.list_releases(github_owner, github_repository, 
+                                                             per_page=100, page=page_number)
+    fetched_releases = fetch_page(1)
+    number_of_pages = api.last_page() or 1 # Última página informada no cabeçalho Link da resposta
     
-    for page_number in range(1, number_of_pages + 1):
-        fetched_releases = api.repos.list_releases(github_owner, github_repository, per_page=100, page=page_number)
+    for fetched_releases in fetch_pages(fetch_page, fetched_releases, number_of_pages):
         for release in fetched_releases:
             if (not release.draft) and (not release.prerelease):
                 releases.append({"id": str(release.id),
@@ -87,7 +123,7 @@ def extract_post_release_timeline(releases: list[dict]=None):
 
 def extract_bug_fix_pull_requests(github_token: str=None, github_owner: str="scikit-learn", 
                                   github_repository: str="scikit-learn", label: str="Bug", 
-                                  closed_since: str=None, closed_to: str=None) -> list[str]:
+                                  closed_since: str=None, closed_to: str=None, api: GhApi=None) -> list[str]:
     """
     Essa função faz a extração de pull requests de bug-fix no período estabelecido 
     [closed_since, closed_to]. 
@@ -99,6 +135,7 @@ def extract_bug_fix_pull_requests(github_token: str=None, github_owner: str="sci
         label (str): O rótulo a ser utilizado na filtragem. Valor padrão é "Bug".
         closed_since (str): Data que define o período inicial de pull request fechados. Valor padrão é None.
         closed_to (str): Data que define o período final de pull request fechados. Valor padrão é None.
+        api (GhApi): Cliente da API do GitHub já configurado; quando informado, github_token é ignorado. Valor padrão é None (cria um novo cliente).
     
     Returns:
         bug_fix_pull_request_numbers (list[str]): Lista contendo os números das pull requests selecionadas.
@@ -106,24 +143,25 @@ def extract_bug_fix_pull_requests(github_token: str=None, github_owner: str="sci
     date_format = "%Y-%m-%d"
     resolution_since = datetime.strptime(closed_since,date_format).strftime(date_format)
     resolution_to = datetime.strptime(closed_to,date_format).strftime(date_format)
-    api = GhApi(token=github_token, owner=github_owner, repo=github_repository)
+    if api is None:
+        api = GhApi(token=github_token, owner=github_owner, repo=github_repository)
     query = f"repo:{github_owner}/{github_repository} is:pr state:closed label:{label} closed:{resolution_since}..{resolution_to}"
-    bug_fix_pull_request_numbers = []
-    fetched_bug_fix_pull_requests = api.search.issues_and_pull_requests(q=query, per_page=100, page=1)
+    bug_fix_pull_request_numbers = set()
+    fetch_page = lambda page_number: api.search.issues_and_pull_requests(q=query, per_page=100, page=page_number)
+    fetched_bug_fix_pull_requests = fetch_page(1)
     number_of_pages = math.ceil(fetched_bug_fix_pull_requests.total_count/100.00)
     
-    for page_number in range(1, number_of_pages + 1):
-        fetched_bug_fix_pull_requests = api.search.issues_and_pull_requests(q=query, per_page=100, page=page_number)
+    for fetched_bug_fix_pull_requests in fetch_pages(fetch_page, fetched_bug_fix_pull_requests, number_of_pages):
         pull_requests = fetched_bug_fix_pull_requests.pop("items")
         for pull_request in pull_requests:
-            bug_fix_pull_request_numbers.append(str(pull_request.number))
+            bug_fix_pull_request_numbers.add(str(pull_request.number))
 
-    return list(set(bug_fix_pull_request_numbers))
+    return list(bug_fix_pull_request_numbers)
 
 
 def extract_bug_fix_commits(github_token: str=None, github_owner: str="scikit-learn", 
                             github_repository: str="scikit-learn", 
-                            bug_fix_pull_request_numbers: list[str]=[]) -> list[str]:
+                            bug_fix_pull_request_numbers: list[str]=[], api: GhApi=None) -> list[str]:
     """
     Essa função faz a extração de commits de bug-fix associados às pull requests de bug-fix. 
     
@@ -132,24 +170,25 @@ def extract_bug_fix_commits(github_token: str=None, github_owner: str="scikit-le
         github_owner (str): O nome do owner do projeto. Valor padrão é "scikit-learn". 
         github_repository (str): O nome do repositório do projeto. Valor padrão é "scikit-learn".
         bug_fix_pull_request_numbers (list[str]): Lista contendo os números das pull requests selecionadas.  Valor padrão [].
+        api (GhApi): Cliente da API do GitHub já configurado; quando informado, github_token é ignorado. Valor padrão é None (cria um novo cliente).
     
     Returns:
         bug_fix_commits (list[str]): Lista contendo os hash dos commits de bug-fix.
     """
-    bug_fix_commits = []
-    api = GhApi(token=github_token, owner=github_owner, repo=github_repository)
+    if api is None:
+        api = GhApi(token=github_token, owner=github_owner, repo=github_repository)
 
-    for pull_request_number in bug_fix_pull_request_numbers:
-        fetched_commits = api.pulls.list_commits(pull_number=pull_request_number)
-        for commit in fetched_commits:
-            bug_fix_commits.append(commit.sha)
+    with ThreadPoolExecutor(max_workers=GITHUB_MAX_WORKERS) as executor:
+        fetched_commits = executor.map(lambda pull_request_number: api.pulls.list_commits(pull_number=pull_request_number),
+                                       bug_fix_pull_request_numbers)
+        bug_fix_commits = {commit.sha for commits in fetched_commits for commit in commits}
     
-    return list(set(bug_fix_commits))
+    return list(bug_fix_commits)
 
 
 def extract_buggy_files(github_token: str=None, github_owner: str="scikit-learn", 
                         github_repository: str="scikit-learn", bug_fix_commits: list[str]=[], 
-                        file_types=[".py"]) -> list[str]:
+                        file_types=[".py"], api: GhApi=None) -> list[str]:
     """
     Essa função faz a extração de commits de bug-fix associados às pull requests de bug-fix. 
     
@@ -159,26 +198,29 @@ def extract_buggy_files(github_token: str=None, github_owner: str="scikit-learn"
         github_repository (str): O nome do repositório do projeto. Valor padrão é "scikit-learn".
         bug_fix_commits (list[str]): Lista contendo os hash dos commits de bug-fix. Valor padrão [].
         file_types (list[str]): Lista de extensão dos tipos de arquivos suportados. Valor padrão [".py"].
+        api (GhApi): Cliente da API do GitHub já configurado; quando informado, github_token é ignorado. Valor padrão é None (cria um novo cliente).
     
     Returns:
         buggy_files (list[str]): Lista contendo os arquivos afetados pelos commits de bug-fix.
     """    
-    buggy_files = []
-    api = GhApi(token=github_token, owner=github_owner, repo=github_repository)
-
-    for bug_fix in bug_fix_commits:
-        fetched_commit = api.repos.get_commit(bug_fix)
-        for file in fetched_commit.files:
-            if str(file.filename).endswith(tuple(file_types)):
-                buggy_files.append(file.filename)
+    buggy_files = set()
+    if api is None:
+        api = GhApi(token=github_token, owner=github_owner, repo=github_repository)
+
+    with ThreadPoolExecutor(max_workers=GITHUB_MAX_WORKERS) as executor:
+        for fetched_commit in executor.map(api.repos.get_commit, bug_fix_commits):
+            for file in fetched_commit.files:
+                if str(file.filename).endswith(tuple(file_types)):
+                    buggy_files.add(file.filename)
     
-    return buggy_files
+    return list(buggy_files)
 
 
 def extract_code_metrics_and_labeling(github_owner: str="scikit-learn", github_repository: str="scikit-learn", 
-                                      release_tag: str=None, buggy_files: list[str]=[]) -> str:
+                                      release_tag: str=None, buggy_files: list[str]=[]) -> Iterator[dict]:
     """
     Essa função faz a extração das métricas de código e rotulagem nos arquivos da release alvo. 
+    As métricas são produzidas sob demanda (streaming), à medida que cada arquivo é analisado.
     
     Parameters:
         github_token (str): O token de acesso do GitHub. Valor padrão é None.
@@ -188,54 +230,88 @@ def extract_code_metrics_and_labeling(github_owner: str="scikit-learn", github_r
         buggy_files (list[str]): Lista contendo os arquivos afetados pelos commits de bug-fix.    
     
     Returns:
-        code_metrics_data (list[dict]): O conjundo de métricas de código e rótulo por arquivo.  
+        code_metrics_data (Iterator[dict]): O conjundo de métricas de código e rótulo por arquivo.  
     """
     local_repo = None
     if os.path.isdir(github_repository) and os.path.isdir(os.path.join(github_repository, '.git')):
         local_repo = git.Repo(github_repository)
+        if release_tag not in local_repo.tags:
+            # Busca a tag alvo; o fetch só é raso se o clone já for raso, preservando o histórico de clones completos
+            shallow = os.path.exists(os.path.join(local_repo.git_dir, "shallow"))
+            fetch_options = ["--depth=1"] if shallow else []
+            local_repo.git.fetch(*fetch_options, "origin", f"refs/tags/{release_tag}:refs/tags/{release_tag}")
+        local_repo.git.checkout(release_tag)
     else:
+        # Clone raso: somente o snapshot da tag alvo, sem o histórico do projeto
         repo_url = f"https://github.com/{github_owner}/{github_repository}.git"
-        local_repo = git.Repo.clone_from(repo_url, github_repository)
+        local_repo = git.Repo.clone_from(repo_url, github_repository, depth=1, 
+                                         branch=release_tag, single_branch=True)
 
-    local_repo.git.checkout(release_tag)
     local_repo_path = f"./{github_repository}/"
-    code_metrics_data = list(pymetrix.scan_directory(local_repo_path))
-    if not code_metrics_data:
-        print("Nenhuma métrica foi coletada.")
-        return
+    code_metrics_data = pymetrix.scan_directory(local_repo_path, cache_path=METRICS_CACHE_PATH)
     
-    buggy_files_full_path = []
-    for i in range(len(buggy_files)):
-        buggy_files_full_path.append(local_repo_path + buggy_files[i])
+    buggy_files_full_path = {local_repo_path + buggy_file for buggy_file in buggy_files}
+    return (dict(row, BUG=1 if row["FILE"] in buggy_files_full_path else 0) #Aplicando o rótulo
+            for row in code_metrics_data)
 
-        for row in code_metrics_data:
-            row['BUG'] = 1 if row["FILE"] in buggy_files_full_path else 0 #Aplicando o rótulo
-    
-    return code_metrics_data
-
-def load_raw_dataset(release_tag: str=None, code_metrics_data:list[dict]=None) -> str:
+def load_raw_dataset(release_tag: str=None, code_metrics_data:Iterable[dict]=None) -> tuple[str, int]:
     """
     Essa função cria um arquivo CSV contendo o conjunto de métricas extraídas por arquivo e seus respectivos rótulos.
-    O nome do arquivo é iniciado pela tag alvo.
+    O nome do arquivo é iniciado pela tag alvo. As linhas são escritas à medida que são produzidas, 
+    sem materializar todo o conjunto de métricas em memória.
     
     Parameters:
         github_repository (str): O nome do repositório do projeto. Valor padrão é "scikit-learn".
         release_tag (str): Tag name da release alvo. Valor padrão None.
-        code_metrics_data (list[dict]): O conjundo de métricas de código e rótulo por arquivo. Valor padrão None.
+        code_metrics_data (Iterable[dict]): O conjundo de métricas de código e rótulo por arquivo. Valor padrão None.
     
     Returns:
         dataset_file_path (str): O caminho para o dataset bruto gerado.  
+        number_of_rows (int): O número de linhas de métricas escritas no dataset.
     """    
     fieldnames = ['FILE', 'LOC', 'COM', 'BLK', 'NOF', 'NOC', 'APF', 'AMC', 'NER', 'NEH', 'CYC', 'MAD', 'BUG'] 
     valid_prefix = release_tag.replace(".", "_")
     dataset_file_path = f"{valid_prefix}_sdp_pos_release_raw_dataset.csv"
     with open(dataset_file_path, mode='w', newline='', encoding='utf-8') as csvfile:
-        writer = csv.DictWriter(csvfile, fieldnames=fieldnames, delimiter=';', quoting=csv.QUOTE_MINIMAL)
-        writer.writeheader()
-        for row in code_metrics_data:
+        writer = csv.writer(csvfile, delimiter=';', quoting=csv.QUOTE_MINIMAL)
+        writer.writerow(fieldnames)
+        number_of_rows = 0
+        for row in map(itemgetter(*fieldnames), code_metrics_data):
             writer.writerow(row)
+            number_of_rows += 1
+
+    if not number_of_rows:
+        print("Nenhuma métrica foi coletada.")
     
-    return dataset_file_path
+    return dataset_file_path, number_of_rows
+
+def zscore_outlier_mask(nums, threshold: float=3.0):
+    """
+    Essa função identifica as linhas sem outliers de uma matriz de métricas, isto é, 
+    as linhas cujo z-score absoluto é menor que o limiar em todas as colunas. 
+    O cálculo é feito diretamente sobre o ndarray, reaproveitando um único buffer para os z-scores.
+
+    Parameters:
+        nums (numpy.ndarray): Matriz (linhas x métricas) de valores em ponto flutuante.
+        threshold (float): O limiar de z-score absoluto. Valor padrão é 3.0.
+
+    Returns:
+        keep (numpy.ndarray): Vetor booleano com True para as linhas que devem ser mantidas.
+    """
+    import numpy as np
+
+    # Com menos de duas linhas o desvio padrão amostral é indefinido: nenhuma linha é mantida
+    if len(nums) < 2:
+        return np.zeros(len(nums), dtype=bool)
+
+    mean = nums.mean(axis=0)
+    std = nums.std(axis=0, ddof=1)
+    z_scores = nums - mean
+    with np.errstate(divide='ignore', invalid='ignore'):
+        z_scores /= std
+    np.abs(z_scores, out=z_scores)
+
+    return (z_scores < threshold).all(axis=1)
 
 def tansform_raw_dataset(dataset_file_path: str=None) -> None:
     """
@@ -252,22 +328,25 @@ def tansform_raw_dataset(dataset_file_path: str=None) -> None:
     Returns:
         transformed_file_path (str): O caminho para o dataset transformado.  
     """
-    transformed_file_path = dataset_file_path.replace("raw", "trf")
-
     # Escreva seu código aqui. Use o pandas para fazer essa tarefa
+    import numpy as np
     import pandas as pd
 
     if dataset_file_path is None:
         dataset_file_path = '1_5_0_sdp_pos_release_raw_dataset.csv'
 
-    df = pd.read_csv(dataset_file_path, sep=';')
-    df = df[~df['FILE'].str.contains(r'(?:test|example|doc|sample)', case=False, na=False)]
+    df = pd.read_csv(dataset_file_path, sep=';', dtype=RAW_DATASET_DTYPES, engine='c')
     num_cols = ['LOC', 'COM', 'BLK', 'NOF', 'NOC', 'APF', 'AMC', 'NER', 'NEH', 'CYC', 'MAD']
-    df = df[~(df[num_cols] == 0).sum(axis=1) > (len(num_cols) * 0.5)]
-    
+    nums = df[num_cols].to_numpy(dtype=np.float32)
+
+    # Regras (1) e (2): máscaras booleanas sobre o array, sem cópias intermediárias do DataFrame
+    keep = ~df['FILE'].str.contains(IRRELEVANT_FILES_PATTERN, na=False).to_numpy()
+    keep &= (nums == 0).sum(axis=1) <= len(num_cols) * 0.5
 
-    z_scores = ((df[num_cols] - df[num_cols].mean()) / df[num_cols].std()).abs()
-    df_filtered = df[(z_scores < 3).all(axis=1)]
+    # Regra (3): z-score calculado apenas sobre as linhas que passaram pelas regras (1) e (2)
+    keep[keep] = zscore_outlier_mask(nums[keep], threshold=3.0)
+
+    df_filtered = df[keep]
 
     transformed_file_path = dataset_file_path.replace("raw", "trf")
     df_filtered.to_csv(transformed_file_path, sep=';', index=False)
@@ -280,8 +359,10 @@ def start():
     
     logger = logging.getLogger(__name__)
     logging.basicConfig(filename='pipeline.log', encoding='utf-8', level=logging.DEBUG)
+    api = GhApi(token=token, owner="scikit-learn", repo="scikit-learn") # Cliente único para todas as etapas
+
     logger.debug("[Step-1] Extraindo Releases Candidatas")
-    releases = extract_non_patch_releases(github_token=token)
+    releases = extract_non_patch_releases(api=api)
     logger.debug(f"\tTotal de releases {len(releases)}: {releases}")
     
     logger.debug("\n[Step-2] Extraindo Relese Alvo e Timeline")
@@ -289,27 +370,27 @@ def start():
     logger.debug(f"\tRelease alvo {release} no período [{start_date}, {end_date}]")
 
     logger.debug("\n[Step-3] Extraindo Pull Request de Bug-Fix")
-    pull_request_numbers = extract_bug_fix_pull_requests(github_token=token,
-                                                         closed_since=start_date,
-                                                         closed_to=end_date)
+    pull_request_numbers = extract_bug_fix_pull_requests(closed_since=start_date,
+                                                         closed_to=end_date,
+                                                         api=api)
     logger.debug(f"\tTotal de pull requests {len(pull_request_numbers)}: {pull_request_numbers}")
     
     logger.debug("\n[Step-4] Extraindo Commits de Bug-Fix")
-    bug_fix_commits = extract_bug_fix_commits(github_token=token, 
-                                              bug_fix_pull_request_numbers=pull_request_numbers)
+    bug_fix_commits = extract_bug_fix_commits(bug_fix_pull_request_numbers=pull_request_numbers,
+                                              api=api)
     logger.debug(f"\tTotal de commits {len(bug_fix_commits)}: {bug_fix_commits}")
     
     logger.debug("\n[Step-5] Extraindo Arquivos Defeituosos")
-    buggy_files = extract_buggy_files(github_token=token,
-                                      bug_fix_commits=bug_fix_commits)
+    buggy_files = extract_buggy_files(bug_fix_commits=bug_fix_commits,
+                                      api=api)
     logger.debug(f"\tTotal de arquivos {len(buggy_files)}: {buggy_files}")
     
     logger.debug("\n[Step-6] Extraindo Métricas de Código e Gerando Dataset Rotulado")
     code_metrics = extract_code_metrics_and_labeling(release_tag=release, buggy_files=buggy_files)
-    logger.debug(f"\tTotal de linhas de métricas {len(code_metrics)-1}")
 
     logger.debug("\n[Step-7] Carregando Dataset Bruto para Arquivo")
-    raw_dataset_path = load_raw_dataset(release_tag=release, code_metrics_data=code_metrics)
+    raw_dataset_path, number_of_rows = load_raw_dataset(release_tag=release, code_metrics_data=code_metrics)
+    logger.debug(f"\tTotal de linhas de métricas {number_of_rows}")
     logger.debug(f"\tNome do dataset criado {raw_dataset_path}")
 
     logger.debug("\n[Step-8] Transformando Dataset Bruto")